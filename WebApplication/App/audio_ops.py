@@ -0,0 +1,39 @@
+"""
+audio_ops.py includes the preprocessing applied to the signal before the feature extraction.
+The helpers loop over the samples, so they are compiled with numba.
+The compiled code is cached in NUMBA_CACHE_DIR, so only the first worker pays for the compilation.
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def trim_silence(data, threshold):
+    """
+    This function removes the leading and trailing samples with an amplitude below the threshold.
+    """
+    start = 0
+    while start < data.shape[0] and abs(data[start]) < threshold:
+        start += 1
+    end = data.shape[0]
+    while end > start and abs(data[end - 1]) < threshold:
+        end -= 1
+    return data[start:end]
+
+
+@njit(cache=True, fastmath=True)
+def normalize(data):
+    """
+    This function scales a signal so that its peak amplitude is 1.
+    Silent signals are returned unchanged.
+    """
+    peak = 0.0
+    for value in data:
+        peak = max(peak, abs(value))
+    if peak == 0.0:
+        return data
+    normalized = np.empty_like(data)
+    for index in range(data.shape[0]):
+        normalized[index] = data[index] / peak
+    return normalized
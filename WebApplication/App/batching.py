@@ -0,0 +1,99 @@
+"""
+batching.py includes the micro-batching of the predictions.
+Concurrent requests put their features in a queue and a single worker thread
+runs them through the model in one call, so the fixed cost of each call is shared.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class PendingPrediction:
+    """
+    A single request waiting in the queue.
+    :param features: The features of the request, with a batch dimension of 1.
+    """
+
+    def __init__(self, features):
+        self.features = features
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PredictionBatcher:
+    """
+    Collects the features of concurrent requests and predicts them in batches.
+    :param infer: Function that takes a batch of features and returns one output row per sample.
+    :param max_batch_size: Maximum number of requests predicted in a single call.
+    :param linger: Seconds to wait for more requests once the first one is received.
+    """
+
+    def __init__(self, infer, max_batch_size=32, linger=0.02):
+        self.infer = infer
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def start(self):
+        """
+        This method starts the worker thread, if it is not running yet.
+        The thread is only started on the first prediction, so that management commands
+        importing the views do not spawn it.
+        """
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='prediction-batcher', daemon=True)
+                self.worker.start()
+
+    def predict(self, features, timeout=10):
+        """
+        This method queues the features of a request and waits for the output of the model.
+        """
+        self.start()
+        pending = PendingPrediction(features)
+        self.queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError('Prediction timed out')
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def collect(self):
+        """
+        This method blocks until a request is received, then gathers the requests
+        received within the linger window, up to max_batch_size.
+        """
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Main loop of the worker thread.
+        """
+        while True:
+            batch = self.collect()
+            try:
+                outputs = self.infer(np.concatenate([pending.features for pending in batch]))
+            except Exception as err:
+                for pending in batch:
+                    pending.error = err
+            else:
+                for pending, output in zip(batch, outputs):
+                    pending.result = output
+            for pending in batch:
+                pending.done.set()
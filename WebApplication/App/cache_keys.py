@@ -0,0 +1,10 @@
+"""
+cache_keys.py includes the keys used to store values in the Django cache.
+"""
+
+# List of the file names in the MEDIA_ROOT
+MEDIA_LIST_KEY = 'media_files'
+
+# Emotion predicted for an audio file, formatted with the fingerprint of the model,
+# the preprocessing settings and the hash of the content of the file
+PREDICTION_KEY = 'emo:{}:{}:{}'
@@ -0,0 +1,59 @@
+"""
+This file can be used to convert the Keras model to an INT8 quantized TFLite model.
+The quantization ranges are calibrated on the features of a directory of audio files,
+for example a few hundred files of the RAVDESS and TESS datasets.
+
+    python -m App.convert_tflite path/to/calibration/files
+
+Once models/Emotion_Voice_Detection_Model.tflite exists, it is used by the Predict view.
+"""
+
+import os
+import sys
+import tempfile
+
+import django
+import tensorflow as tf
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DjangoRestDeepLearning.settings')
+django.setup()
+
+from App.features import extract_features
+from App.predict_view import MODEL_PATH
+from App.predict_view import TFLITE_MODEL_PATH
+
+
+def representative_dataset(directory):
+    """
+    This function yields the features of the audio files in a directory, one at a time.
+    Subdirectories are skipped.
+    """
+    with os.scandir(directory) as entries:
+        paths = sorted(entry.path for entry in entries if entry.is_file())
+    for path in paths:
+        features = extract_features(path)
+        yield [features[None, :, None]]
+
+
+def convert(directory):
+    """
+    This function converts the Keras model and writes the TFLite model next to it.
+    The model is written to a temporary file that then replaces the previous one, so that
+    a failed conversion or write never leaves a partial model to be loaded by the views.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model_file(MODEL_PATH)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = tf.lite.RepresentativeDataset(lambda: representative_dataset(directory))
+    converter.target_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(TFLITE_MODEL_PATH), delete=False) as model_file:
+        try:
+            model_file.write(tflite_model)
+        except (IOError, OSError):
+            os.remove(model_file.name)
+            raise
+    os.replace(model_file.name, TFLITE_MODEL_PATH)
+
+
+if __name__ == '__main__':
+    convert(sys.argv[1])
@@ -0,0 +1,139 @@
+"""
+features.py includes the audio feature extraction used for the predictions.
+It reproduces librosa.feature.mfcc with the parameters the model was trained with,
+without going through the general purpose librosa pipeline.
+Everything is computed in float32, the dtype the model expects.
+"""
+
+import io
+import tempfile
+from functools import lru_cache
+
+import librosa
+import numpy as np
+import soundfile
+from django.conf import settings
+from scipy.fft import dct
+from scipy.fft import rfft
+from scipy.signal import get_window
+
+from App.audio_ops import normalize
+from App.audio_ops import trim_silence
+
+# librosa.load default, used when the model was trained
+SAMPLING_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 40
+AMIN = 1e-10
+TOP_DB = 80.0
+
+WINDOW = get_window('hann', N_FFT, fftbins=True).astype(np.float32)
+DCT_BASIS = dct(np.eye(N_MELS), type=2, norm='ortho', axis=0)[:N_MFCC].astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def mel_basis(sampling_rate):
+    """
+    This function returns the mel filterbank for a sampling rate.
+    It is computed once per sampling rate and then reused.
+    """
+    return librosa.filters.mel(sr=sampling_rate, n_fft=N_FFT, n_mels=N_MELS).astype(np.float32)
+
+
+def resample(data, sampling_rate):
+    """
+    This function resamples a signal to SAMPLING_RATE, with the same resampler as librosa.load.
+    Signals already at SAMPLING_RATE are returned unchanged.
+    """
+    if sampling_rate == SAMPLING_RATE:
+        return data
+    return librosa.resample(data, orig_sr=sampling_rate, target_sr=SAMPLING_RATE, res_type='kaiser_best')
+
+
+def power_spectrogram(data):
+    """
+    This function returns the power spectrogram of a signal, with frames
+    centered and reflection padded like librosa.stft.
+    """
+    padded = np.pad(np.asarray(data, dtype=np.float32), N_FFT // 2, mode='reflect')
+    n_frames = 1 + (len(padded) - N_FFT) // HOP_LENGTH
+    frames = np.lib.stride_tricks.as_strided(
+        padded,
+        shape=(n_frames, N_FFT),
+        strides=(padded.strides[0] * HOP_LENGTH, padded.strides[0]))
+    # scipy.fft keeps single precision, numpy.fft would promote to complex128
+    spectrum = rfft(frames * WINDOW, axis=1)
+    # Squaring the parts directly avoids the square root of np.abs
+    power = np.square(spectrum.real)
+    power += np.square(spectrum.imag)
+    return power.T
+
+
+def log_mel_spectrogram(data, sampling_rate):
+    """
+    This function returns the (N_MELS, frames) mel spectrogram of a signal in decibels,
+    like librosa.power_to_db with top_db=80. The intermediate steps are done in place.
+    """
+    log_mel = mel_basis(sampling_rate) @ power_spectrogram(data)
+    np.maximum(log_mel, AMIN, out=log_mel)
+    np.log10(log_mel, out=log_mel)
+    log_mel *= 10.0
+    np.maximum(log_mel, log_mel.max() - TOP_DB, out=log_mel)
+    return log_mel
+
+
+def mfcc(data, sampling_rate):
+    """
+    This function returns the (N_MFCC, frames) matrix of MFCCs of a signal.
+    It is equivalent to librosa.feature.mfcc(y=data, sr=sampling_rate, n_mfcc=N_MFCC).
+    """
+    return DCT_BASIS @ log_mel_spectrogram(data, sampling_rate)
+
+
+def mean_mfcc(data, sampling_rate):
+    """
+    This function returns the (N_MFCC,) vector of MFCCs of a signal averaged over time.
+    The DCT is linear, so the time average is taken before it: the DCT is applied to
+    a single vector instead of every frame.
+    """
+    log_mel = log_mel_spectrogram(data, sampling_rate)
+    return DCT_BASIS @ log_mel.mean(axis=1, dtype=np.float32)
+
+
+def decode(audio):
+    """
+    This function decodes an audio file into a mono float32 signal and its sampling rate.
+    libsndfile cannot decode some formats, such as mp3. Those are loaded with librosa,
+    whose audioread backends need a path, so in-memory content is written to a temporary file.
+    :param audio: The content of the file as bytes, or the path of the file.
+    """
+    try:
+        source = io.BytesIO(audio) if isinstance(audio, bytes) else audio
+        data, sampling_rate = soundfile.read(source, dtype='float32', always_2d=False)
+    except RuntimeError:
+        if not isinstance(audio, bytes):
+            return librosa.load(audio, sr=None, dtype=np.float32)
+        with tempfile.NamedTemporaryFile() as temp_file:
+            temp_file.write(audio)
+            temp_file.flush()
+            return librosa.load(temp_file.name, sr=None, dtype=np.float32)
+    if data.ndim > 1:
+        data = librosa.to_mono(data.T)
+    return data, sampling_rate
+
+
+def extract_features(audio):
+    """
+    This function decodes an audio file and returns its (N_MFCC,) vector of MFCCs averaged over time.
+    It is defined at module level so it can be run in a worker process.
+    :param audio: The content of the file as bytes, or the path of the file.
+    """
+    data, sampling_rate = decode(audio)
+    if settings.TRIM_SILENCE_THRESHOLD is not None:
+        data = trim_silence(data, settings.TRIM_SILENCE_THRESHOLD)
+    if settings.NORMALIZE_AUDIO:
+        data = normalize(data)
+    data = resample(data, sampling_rate)
+    return mean_mfcc(data, SAMPLING_RATE)
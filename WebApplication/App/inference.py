@@ -0,0 +1,109 @@
+"""
+inference.py includes the classes running the emotion detection model.
+Both classes are called with a batch of features of shape (batch, N_MFCC, 1)
+and return one row of class scores per sample.
+"""
+
+import threading
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+
+class KerasModel:
+    """
+    Runs the Keras model.
+    A backend function runs the graph directly, skipping the batching and
+    callback machinery of model.predict() on every call.
+    :param path: Path of the .h5 model file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.model = keras.models.load_model(path, compile=False)
+        # Keras keeps its session per thread, and the weights are only initialized
+        # in this one, so the graph and session are used explicitly by __call__
+        self.graph = tf.get_default_graph()
+        self.session = keras.backend.get_session()
+        self.function = keras.backend.function([self.model.input], [self.logits(self.model)])
+
+    @staticmethod
+    def logits(model):
+        """
+        This method returns the output of the model before its final softmax, if it ends with one.
+        The softmax does not change the argmax, so it does not need to be computed.
+        """
+        last_layer = model.layers[-1]
+        if getattr(last_layer, 'activation', None) is not keras.activations.softmax:
+            return model.output
+        if isinstance(last_layer, keras.layers.Activation):
+            return last_layer.input
+        if not isinstance(last_layer, keras.layers.Dense):
+            return model.output
+        # The softmax is the activation of the last Dense layer
+        logits = keras.backend.dot(last_layer.input, last_layer.kernel)
+        if last_layer.use_bias:
+            logits = keras.backend.bias_add(logits, last_layer.bias)
+        return logits
+
+    def __call__(self, features):
+        with self.graph.as_default(), self.session.as_default():
+            return self.function([features])[0]
+
+
+class TFLiteModel:
+    """
+    Runs the INT8 quantized TFLite model generated by convert_tflite.py.
+    TFLite interpreters are not thread safe, so each thread gets its own.
+    :param path: Path of the .tflite model file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        # Fail at load time, like KerasModel, if the model cannot be read
+        self.interpreter()
+
+    def interpreter(self):
+        """
+        This method returns the interpreter of the current thread, with its tensors allocated.
+        """
+        interpreter = getattr(self.local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_path=self.path)
+            interpreter.allocate_tensors()
+            self.local.interpreter = interpreter
+        return interpreter
+
+    @staticmethod
+    def quantize(values, details):
+        """
+        This method converts float values to the dtype of an input tensor.
+        """
+        scale, zero_point = details['quantization']
+        if details['dtype'] == np.float32 or scale == 0:
+            return values.astype(details['dtype'])
+        return np.round(values / scale + zero_point).astype(details['dtype'])
+
+    @staticmethod
+    def dequantize(values, details):
+        """
+        This method converts the values of an output tensor to float.
+        """
+        scale, zero_point = details['quantization']
+        if details['dtype'] == np.float32 or scale == 0:
+            return values.astype(np.float32)
+        return (values.astype(np.float32) - zero_point) * scale
+
+    def __call__(self, features):
+        interpreter = self.interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        # The converted model has a fixed batch size of 1
+        outputs = []
+        for sample in features:
+            interpreter.set_tensor(input_details['index'], self.quantize(sample[None], input_details))
+            interpreter.invoke()
+            outputs.append(self.dequantize(interpreter.get_tensor(output_details['index']), output_details)[0])
+        return np.stack(outputs)
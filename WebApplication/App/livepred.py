@@ -4,7 +4,6 @@ This file can be used to try a live prediction.
 
 import keras
 import librosa
-import numpy as np
 
 
 
@@ -26,9 +25,8 @@ class LivePredictions:
         Method to process the files and create your features.
         """
         data, sampling_rate = librosa.load(self.file)
-        mfccs = np.mean(librosa.feature.mfcc(y=data, sr=sampling_rate, n_mfcc=40).T, axis=0)
-        x = np.expand_dims(mfccs, axis=2)
-        x = np.expand_dims(x, axis=0)
+        mfccs = librosa.feature.mfcc(y=data, sr=sampling_rate, n_mfcc=40).mean(axis=1)
+        x = mfccs[None, :, None]
         predictions = self.loaded_model.predict_classes(x)
         print( "Prediction is", " ", self.convert_class_to_emotion(predictions))
 
@@ -4,9 +4,13 @@ Models.py includes the database structure of the application.
 
 from django.db import models
 from django.conf import settings
+from django.core.cache import cache
 from django.dispatch import receiver
+from django.db.models.signals import post_save
 from django.db.models.signals import post_delete
 
+from App.cache_keys import MEDIA_LIST_KEY
+
 
 class FileModel(models.Model):
     file = models.FileField(null=True, blank=True)
@@ -24,3 +28,12 @@ def submission_delete(sender, instance, **kwargs):
     Django does not do this automatically.
     """
     instance.file.delete(False)
+    cache.delete(MEDIA_LIST_KEY)
+
+
+@receiver(post_save, sender=FileModel)
+def submission_save(sender, instance, **kwargs):
+    """
+    This function is used to refresh the cached list of files when a file object is saved.
+    """
+    cache.delete(MEDIA_LIST_KEY)
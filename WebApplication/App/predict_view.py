@@ -0,0 +1,280 @@
+"""
+predict_view.py includes the emotion predictions of the application.
+It is kept apart from views.py so that the rest of the site, and the management
+commands importing it, do not load TensorFlow, Keras and librosa.
+"""
+
+import os
+import hashlib
+import threading
+import multiprocessing
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import views
+from rest_framework import status
+from rest_framework.parsers import FormParser
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+
+from App.batching import PredictionBatcher
+from App.cache_keys import PREDICTION_KEY
+from App.features import N_MFCC
+from App.features import extract_features
+from App.inference import KerasModel
+from App.inference import TFLiteModel
+from App.views import list_media_files
+
+
+# Emotions in the order of the classes of the model
+EMOTION_LABELS = ('neutral', 'calm', 'happy', 'sad', 'angry', 'fearful', 'disgust', 'surprised')
+
+MODEL_PATH = os.path.join(settings.MODEL_ROOT, 'Emotion_Voice_Detection_Model.h5')
+TFLITE_MODEL_PATH = os.path.join(settings.MODEL_ROOT, 'Emotion_Voice_Detection_Model.tflite')
+
+# Number of files predicted in a single call by BulkPredict
+BULK_BATCH_SIZE = 64
+
+# Maximum number of files in a BulkPredict request, so that one request
+# does not hold the process pool used by the single predictions
+BULK_MAX_FILES = 256
+
+# Seconds a request waits for the features of a file
+FEATURES_TIMEOUT = 30
+
+
+def load_model():
+    """
+    This function loads the INT8 TFLite model if it has been generated with convert_tflite.py,
+    and the Keras model otherwise, or if the TFLite model cannot be read.
+    It returns None if the Keras model file is missing or cannot be read, and the view
+    then answers with a 503 status instead of failing.
+    """
+    if os.path.isfile(TFLITE_MODEL_PATH):
+        try:
+            return TFLiteModel(TFLITE_MODEL_PATH)
+        except (IOError, OSError, ValueError):
+            pass
+    try:
+        return KerasModel(MODEL_PATH)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def model_fingerprint(model):
+    """
+    This function returns a hash of the content of the file of the loaded model.
+    It is part of the prediction cache keys, so that a new model does not reuse
+    the labels cached for the previous one.
+    """
+    if model is None:
+        return ''
+    digest = hashlib.blake2b(digest_size=8)
+    try:
+        with open(model.path, 'rb') as model_file:
+            for block in iter(lambda: model_file.read(1024 * 1024), b''):
+                digest.update(block)
+    except (IOError, OSError):
+        return ''
+    return digest.hexdigest()
+
+
+def prediction_key(audio_digest):
+    """
+    This function returns the cache key of the prediction of an audio file,
+    which changes with the model and with the preprocessing settings.
+    """
+    preprocessing = '{}-{}'.format(settings.TRIM_SILENCE_THRESHOLD, settings.NORMALIZE_AUDIO)
+    return PREDICTION_KEY.format(MODEL_FINGERPRINT, preprocessing, audio_digest)
+
+
+# The model is loaded once per process and shared by every request.
+# Loading it in the view constructor would rebuild the graph on each POST,
+# since Django instantiates a new view for every request.
+# It must be loaded after the gunicorn workers are forked, not in a --preload master,
+# as the TF session does not survive the fork.
+MODEL = None
+MODEL_FINGERPRINT = ''
+MODEL_PID = None
+MODEL_LOCK = threading.Lock()
+
+
+def get_model():
+    """
+    This function returns the model of the current process, loading it on first use.
+    It is not loaded at import, so that a gunicorn master importing the views
+    does not create the TF session before forking the workers.
+    The model is run once after loading, so the first request does not pay for the warm-up.
+    """
+    global MODEL, MODEL_FINGERPRINT, MODEL_PID
+    with MODEL_LOCK:
+        if MODEL_PID != os.getpid():
+            MODEL = load_model()
+            MODEL_FINGERPRINT = model_fingerprint(MODEL)
+            if MODEL is not None:
+                MODEL(np.zeros((1, N_MFCC, 1), dtype=np.float32))
+            MODEL_PID = os.getpid()
+        return MODEL
+
+
+def infer(features):
+    """
+    This function runs the model of the current process on a batch of features.
+    """
+    return get_model()(features)
+
+
+BATCHER = PredictionBatcher(infer)
+
+# Feature extraction is CPU bound Python and NumPy code, so it runs in a pool of
+# FEATURE_WORKERS processes instead of the request threads, which share the GIL.
+EXECUTOR = None
+EXECUTOR_PID = None
+EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor():
+    """
+    This function returns the process pool of the current process, creating it on first use.
+    It is not created at import: the gunicorn workers forked from a --preload master
+    would share its queues and mix up each other's results.
+    The pool processes are started by a forkserver, so they do not inherit the TF runtime.
+    """
+    global EXECUTOR, EXECUTOR_PID
+    with EXECUTOR_LOCK:
+        if EXECUTOR is None or EXECUTOR_PID != os.getpid():
+            EXECUTOR = ProcessPoolExecutor(max_workers=settings.FEATURE_WORKERS,
+                                           mp_context=multiprocessing.get_context('forkserver'))
+            EXECUTOR_PID = os.getpid()
+        return EXECUTOR
+
+
+def discard_executor(executor):
+    """
+    This function drops a broken process pool, so that the next call to get_executor creates a new one.
+    """
+    global EXECUTOR
+    with EXECUTOR_LOCK:
+        if EXECUTOR is executor:
+            EXECUTOR = None
+    executor.shutdown(wait=False)
+
+
+def extract_in_pool(audios):
+    """
+    This function extracts the features of audio files in the process pool and returns them in order.
+    Each file waits at most FEATURES_TIMEOUT seconds. A pool broken by the death of
+    one of its processes, for example killed when out of memory, is replaced.
+    :param audios: The contents of the files as bytes, or their paths.
+    """
+    executor = get_executor()
+    pending = []
+    try:
+        pending = [executor.submit(extract_features, audio) for audio in audios]
+        return [future.result(timeout=FEATURES_TIMEOUT) for future in pending]
+    except BrokenProcessPool:
+        discard_executor(executor)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class Predict(views.APIView):
+    """
+    This class contains the method to predict the emotion of an audio file.
+    POST requests are accepted.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, format=None):
+        audio_file = request.FILES.get('file', None)
+        if not audio_file:
+            return Response({'error': 'No audio file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if get_model() is None:
+            return Response({'error': 'Model not available'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # Large uploads are already written to a temporary file by Django, which the
+        # workers read directly. Smaller ones are kept in memory.
+        on_disk = hasattr(audio_file, 'temporary_file_path')
+
+        # Identical uploads get the cached prediction, keyed on a hash of their content
+        digest = hashlib.blake2b(digest_size=16)
+        chunks = []
+        for chunk in audio_file.chunks():
+            digest.update(chunk)
+            if not on_disk:
+                chunks.append(chunk)
+        cache_key = prediction_key(digest.hexdigest())
+        emotion_label = cache.get(cache_key)
+        if emotion_label is not None:
+            return Response({'prediction': emotion_label}, status=status.HTTP_200_OK)
+
+        audio = audio_file.temporary_file_path() if on_disk else b''.join(chunks)
+
+        try:
+            mfccs = extract_in_pool([audio])[0]
+            features = mfccs[None, :, None]
+            preds = BATCHER.predict(features)
+            predicted_class = int(np.argmax(preds))
+            emotion_label = self.classtoemotion(predicted_class)
+        except (TimeoutError, futures.TimeoutError):
+            return Response({'error': 'Prediction timed out'}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except BrokenProcessPool:
+            return Response({'error': 'Feature extraction failed'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache.set(cache_key, emotion_label, 3600)
+        return Response({'prediction': emotion_label}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def classtoemotion(pred):
+        """
+        Method to convert the predictions (int) into human readable strings.
+        """
+        return EMOTION_LABELS[pred] if 0 <= pred < len(EMOTION_LABELS) else 'unknown'
+
+
+class BulkPredict(views.APIView):
+    """
+    This class contains the method to predict the emotions of several files of the server at once.
+    POST requests are accepted, with the names of at most BULK_MAX_FILES files in the MEDIA_ROOT as 'files'.
+    The features of the files are extracted in parallel by the process pool,
+    then predicted in batches of BULK_BATCH_SIZE.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, format=None):
+        file_names = request.data.getlist('files')
+        if not file_names:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(file_names) > BULK_MAX_FILES:
+            return Response({'error': 'At most {} files can be predicted at once'.format(BULK_MAX_FILES)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        model = get_model()
+        if model is None:
+            return Response({'error': 'Model not available'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        missing = sorted(set(file_names) - set(list_media_files()))
+        if missing:
+            return Response({'error': 'Files not found', 'files': missing}, status=status.HTTP_404_NOT_FOUND)
+
+        paths = [os.path.join(settings.MEDIA_ROOT, file_name) for file_name in file_names]
+        try:
+            features = np.stack(extract_in_pool(paths))[:, :, None]
+            preds = np.concatenate([model(features[start:start + BULK_BATCH_SIZE])
+                                    for start in range(0, len(features), BULK_BATCH_SIZE)])
+        except futures.TimeoutError:
+            return Response({'error': 'Prediction timed out'}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        except BrokenProcessPool:
+            return Response({'error': 'Feature extraction failed'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        predictions = {file_name: Predict.classtoemotion(int(np.argmax(pred)))
+                       for file_name, pred in zip(file_names, preds)}
+        return Response({'predictions': predictions}, status=status.HTTP_200_OK)
@@ -2,16 +2,42 @@
 tests.py includes all the tests of the application.
 """
 
+import io
 import os
+import tempfile
+import threading
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
 
+import keras
+import librosa
+import numpy as np
+import soundfile
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from App.views import Predict
+from App import convert_tflite
+from App import predict_view
+from App.predict_view import Predict
+from App.predict_view import BulkPredict
+from App.views import FileView
+from App.views import SelectFileDelView
+from App.views import list_media_files
+from App.models import FileModel
 from App.forms import FileForm
+from App.audio_ops import normalize
+from App.audio_ops import trim_silence
+from App.batching import PredictionBatcher
+from App.features import N_MFCC
+from App.features import mfcc
+from App.features import mean_mfcc
+from App.features import decode
+from App.inference import KerasModel
+from App.inference import TFLiteModel
 
 
 class TestFileUpload(TestCase):
@@ -56,6 +82,8 @@ class TestPredict(TestCase):
         self.assertEqual(Predict.classtoemotion(5), "fearful")
         self.assertEqual(Predict.classtoemotion(6), "disgust")
         self.assertEqual(Predict.classtoemotion(7), "surprised")
+        self.assertEqual(Predict.classtoemotion(8), "unknown")
+        self.assertEqual(Predict.classtoemotion(-1), "unknown")
 
 
 class TestTemplates(TestCase):
@@ -126,3 +154,401 @@ class TestFileUploadForm(TestCase):
         form_data = {'file': '123.txt'}
         form = FileForm(data=form_data)
         self.assertTrue(form.is_valid())
+
+
+class TestFeatures(TestCase):
+
+    def testmfccmatcheslibrosa(self):
+        """
+        Ensure mfcc gives the same features as librosa.feature.mfcc
+        """
+        sampling_rate = 22050
+        time = np.arange(sampling_rate) / sampling_rate
+        data = np.sin(2 * np.pi * 440 * time) + 0.1 * np.sin(2 * np.pi * 3000 * time)
+        expected = librosa.feature.mfcc(y=data, sr=sampling_rate, n_mfcc=N_MFCC)
+        np.testing.assert_allclose(mfcc(data, sampling_rate), expected, rtol=1e-4, atol=1e-3)
+
+    def testdecode(self):
+        """
+        Ensure a file is decoded the same from its content and from its path
+        """
+        sampling_rate = 16000
+        data = np.random.RandomState(0).uniform(-1, 1, (sampling_rate, 2)).astype(np.float32)
+        buffer = io.BytesIO()
+        soundfile.write(buffer, data, sampling_rate, format='WAV', subtype='FLOAT')
+        with tempfile.NamedTemporaryFile(suffix='.wav') as audio_file:
+            audio_file.write(buffer.getvalue())
+            audio_file.flush()
+            from_path, path_rate = decode(audio_file.name)
+        from_bytes, bytes_rate = decode(buffer.getvalue())
+        self.assertEqual(path_rate, sampling_rate)
+        self.assertEqual(bytes_rate, sampling_rate)
+        np.testing.assert_allclose(from_bytes, data.mean(axis=1), rtol=1e-6)
+        np.testing.assert_array_equal(from_path, from_bytes)
+
+    def testmeanmfcc(self):
+        """
+        Ensure mean_mfcc gives the time average of mfcc
+        """
+        sampling_rate = 22050
+        data = np.random.RandomState(0).uniform(-1, 1, sampling_rate).astype(np.float32)
+        np.testing.assert_allclose(mean_mfcc(data, sampling_rate), mfcc(data, sampling_rate).mean(axis=1),
+                                   rtol=1e-4, atol=1e-3)
+
+
+class TestPredictionBatcher(TestCase):
+
+    def testpredict(self):
+        """
+        Ensure each request gets back its own row of the batch output
+        """
+        batcher = PredictionBatcher(lambda batch: batch * 2)
+        features = np.arange(N_MFCC, dtype=np.float32).reshape(1, N_MFCC, 1)
+        np.testing.assert_array_equal(batcher.predict(features), features[0] * 2)
+
+    def testpredicterror(self):
+        """
+        Ensure errors raised by the model are raised in the requesting thread
+        """
+        def infer(batch):
+            raise ValueError('bad input')
+        batcher = PredictionBatcher(infer)
+        with self.assertRaises(ValueError):
+            batcher.predict(np.zeros((1, N_MFCC, 1), dtype=np.float32))
+
+
+class TestSelectFileDelView(TestCase):
+
+    def testprimarykeys(self):
+        """
+        Ensure the primary keys of all the files are fetched with a single query
+        """
+        with tempfile.TemporaryDirectory() as media_path, self.settings(MEDIA_ROOT=media_path):
+            for name in ('a.wav', 'b.wav'):
+                open(os.path.join(media_path, name), 'wb').close()
+            file_object = FileModel.objects.create(file='a.wav')
+            cache.clear()
+            with self.assertNumQueries(1):
+                context = SelectFileDelView().get_context_data()
+            self.assertEqual(dict(context['filename']), {'a.wav': file_object.pk, 'b.wav': None})
+
+
+class TestMediaFilesCache(TestCase):
+
+    def testinvalidation(self):
+        """
+        Ensure the cached list of files is refreshed when a file object is saved or deleted
+        """
+        with tempfile.TemporaryDirectory() as media_path, self.settings(MEDIA_ROOT=media_path):
+            cache.clear()
+            self.assertEqual(list_media_files(), [])
+            open(os.path.join(media_path, 'a.wav'), 'wb').close()
+            self.assertEqual(list_media_files(), [])
+            file_object = FileModel.objects.create(file='a.wav')
+            self.assertEqual(list_media_files(), ['a.wav'])
+            file_object.delete()
+            self.assertEqual(list_media_files(), [])
+
+
+class TestAudioOps(TestCase):
+
+    def testtrimsilence(self):
+        """
+        Ensure leading and trailing silence is removed
+        """
+        data = np.array([0, 0.001, 0.5, 0, -0.5, 0.001, 0], dtype=np.float32)
+        np.testing.assert_array_equal(trim_silence(data, 0.01), data[2:5])
+
+    def testnormalize(self):
+        """
+        Ensure the peak amplitude is scaled to 1
+        """
+        data = np.array([0.25, -0.5, 0.1], dtype=np.float32)
+        np.testing.assert_allclose(normalize(data), [0.5, -1, 0.2])
+        np.testing.assert_array_equal(normalize(np.zeros(3, dtype=np.float32)), np.zeros(3))
+
+
+class TestFileChecks(TestCase):
+
+    def testfileexists(self):
+        """
+        Ensure the file checks only report files that are on the server
+        """
+        with tempfile.TemporaryDirectory() as media_path, self.settings(MEDIA_ROOT=media_path):
+            open(os.path.join(media_path, 'a.wav'), 'wb').close()
+            self.assertTrue(FileView.check_file_exists('a.wav'))
+            self.assertTrue(FileView.check_resource_exists('a.wav'))
+            self.assertFalse(FileView.check_file_exists('b.wav'))
+            self.assertFalse(FileView.check_resource_exists('b.wav'))
+
+    def testobjectexists(self):
+        """
+        Ensure the object check only reports files that are in the database
+        """
+        FileModel.objects.create(file='a.wav')
+        self.assertTrue(FileView.check_object_exists('a.wav'))
+        self.assertFalse(FileView.check_object_exists('b.wav'))
+
+
+class TestBulkPredict(TestCase):
+
+    @staticmethod
+    def post(file_names):
+        """
+        Post a bulk prediction of the given files
+        """
+        factory = APIRequestFactory()
+        return BulkPredict.as_view()(factory.post('App/bulkpredict', {'files': file_names}))
+
+    def testnofiles(self):
+        """
+        Ensure a bulk prediction without files is rejected
+        """
+        self.assertEqual(self.post([]).status_code, 400)
+
+    def testtoomanyfiles(self):
+        """
+        Ensure a bulk prediction of more than BULK_MAX_FILES files is rejected
+        """
+        file_names = ['{}.wav'.format(index) for index in range(predict_view.BULK_MAX_FILES + 1)]
+        with mock.patch.object(predict_view, 'get_model', return_value=mock.Mock()):
+            self.assertEqual(self.post(file_names).status_code, 400)
+
+    def testunknownfiles(self):
+        """
+        Ensure files that are not on the server are reported
+        """
+        with mock.patch.object(predict_view, 'get_model', return_value=mock.Mock()), \
+                mock.patch.object(predict_view, 'list_media_files', return_value=['a.wav']):
+            response = self.post(['a.wav', 'b.wav'])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['files'], ['b.wav'])
+
+    def testpredictions(self):
+        """
+        Ensure each file gets its own label when the files span several batches
+        """
+        file_names = ['{}.wav'.format(index) for index in range(predict_view.BULK_BATCH_SIZE * 2 + 1)]
+        # The first feature of each file is the class the stub model predicts for it
+        features = [np.full(N_MFCC, index % 8, dtype=np.float32) for index in range(len(file_names))]
+        model = mock.Mock(side_effect=lambda batch: np.eye(8)[batch[:, 0, 0].astype(int)])
+        with mock.patch.object(predict_view, 'get_model', return_value=model), \
+                mock.patch.object(predict_view, 'list_media_files', return_value=file_names), \
+                mock.patch.object(predict_view, 'extract_in_pool', return_value=features):
+            response = self.post(file_names)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(model.call_count, 3)
+        self.assertEqual(response.data['predictions'],
+                         {name: Predict.classtoemotion(index % 8) for index, name in enumerate(file_names)})
+
+
+class TestKerasModel(TestCase):
+
+    @staticmethod
+    def save_model(path):
+        """
+        Save a tiny model with the input shape of the emotion detection model
+        """
+        model = keras.models.Sequential([
+            keras.layers.Flatten(input_shape=(N_MFCC, 1)),
+            keras.layers.Dense(8, activation='softmax'),
+        ])
+        model.save(path)
+        return model
+
+    def testotherthread(self):
+        """
+        Ensure the model can be called from a thread other than the one that loaded it
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.h5')
+            self.save_model(path)
+            keras_model = KerasModel(path)
+        features = np.random.RandomState(0).normal(size=(2, N_MFCC, 1)).astype(np.float32)
+        outputs = []
+        thread = threading.Thread(target=lambda: outputs.append(keras_model(features)))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(outputs), 1)
+        np.testing.assert_allclose(outputs[0], keras_model(features), rtol=1e-6)
+
+    def testlogits(self):
+        """
+        Ensure the softmax of the last Dense layer is skipped without changing the predicted class
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.h5')
+            self.save_model(path)
+            keras_model = KerasModel(path)
+        features = np.random.RandomState(0).normal(size=(16, N_MFCC, 1)).astype(np.float32)
+        with keras_model.graph.as_default(), keras_model.session.as_default():
+            kernel, bias = keras_model.model.layers[-1].get_weights()
+            probabilities = keras_model.model.predict(features)
+        logits = keras_model(features)
+        np.testing.assert_allclose(logits, features.reshape(len(features), -1) @ kernel + bias,
+                                   rtol=1e-5, atol=1e-5)
+        np.testing.assert_array_equal(logits.argmax(axis=1), probabilities.argmax(axis=1))
+
+
+class TestFeatureExecutor(TestCase):
+
+    def testperprocess(self):
+        """
+        Ensure each process gets its own process pool
+        """
+        executor = predict_view.get_executor()
+        self.assertIs(predict_view.get_executor(), executor)
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(predict_view.get_executor(), executor)
+
+    def testfeatureworkers(self):
+        """
+        Ensure the process pool has FEATURE_WORKERS processes
+        """
+        with self.settings(FEATURE_WORKERS=2), mock.patch('os.getpid', return_value=-2):
+            self.assertEqual(predict_view.get_executor()._max_workers, 2)
+
+    def testbrokenpool(self):
+        """
+        Ensure a broken process pool is replaced for the next requests
+        """
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        with mock.patch.object(predict_view, 'EXECUTOR', broken), \
+                mock.patch.object(predict_view, 'EXECUTOR_PID', os.getpid()):
+            with self.assertRaises(BrokenProcessPool):
+                predict_view.extract_in_pool([b''])
+            broken.shutdown.assert_called_once_with(wait=False)
+            self.assertIsNot(predict_view.get_executor(), broken)
+
+
+class TestModelLoading(TestCase):
+
+    def testperprocess(self):
+        """
+        Ensure the model is loaded and warmed up once per process
+        """
+        with mock.patch.object(predict_view, 'MODEL', None), \
+                mock.patch.object(predict_view, 'MODEL_PID', None), \
+                mock.patch.object(predict_view, 'load_model', side_effect=lambda: mock.Mock()) as load_model:
+            model = predict_view.get_model()
+            self.assertIs(predict_view.get_model(), model)
+            self.assertEqual(load_model.call_count, 1)
+            model.assert_called_once()
+            with mock.patch('os.getpid', return_value=-1):
+                self.assertIsNot(predict_view.get_model(), model)
+            self.assertEqual(load_model.call_count, 2)
+
+
+class TestPredictCache(TestCase):
+
+    def post(self):
+        """
+        Post the same upload to the Predict view
+        """
+        factory = APIRequestFactory()
+        request = factory.post('App/predict', {'file': SimpleUploadedFile('file.wav', b'file_content')})
+        return Predict.as_view()(request)
+
+    def testcachedprediction(self):
+        """
+        Ensure the same upload is predicted once, unless the preprocessing changes
+        """
+        cache.clear()
+        model = mock.Mock()
+        with mock.patch.object(predict_view, 'get_model', return_value=model), \
+                mock.patch.object(predict_view, 'extract_in_pool') as extract_in_pool, \
+                mock.patch.object(predict_view, 'BATCHER') as batcher:
+            extract_in_pool.return_value = [np.zeros(N_MFCC, dtype=np.float32)]
+            batcher.predict.return_value = np.eye(8)[2]
+            self.assertEqual(self.post().data, {'prediction': 'happy'})
+            self.assertEqual(extract_in_pool.call_count, 1)
+            self.assertEqual(batcher.predict.call_count, 1)
+
+            self.assertEqual(self.post().data, {'prediction': 'happy'})
+            self.assertEqual(extract_in_pool.call_count, 1)
+            self.assertEqual(batcher.predict.call_count, 1)
+
+            with self.settings(NORMALIZE_AUDIO=True):
+                self.post()
+            self.assertEqual(extract_in_pool.call_count, 2)
+
+
+class TestTFLiteModel(TestCase):
+
+    def testquantizeint8(self):
+        """
+        Ensure int8 values round-trip within half a quantization step
+        """
+        details = {'dtype': np.int8, 'quantization': (0.5, 3)}
+        values = np.array([[-10.0, 0.2, 7.6]], dtype=np.float32)
+        quantized = TFLiteModel.quantize(values, details)
+        self.assertEqual(quantized.dtype, np.int8)
+        np.testing.assert_allclose(TFLiteModel.dequantize(quantized, details), values, atol=0.25)
+
+    def testquantizefloat32(self):
+        """
+        Ensure float32 tensors are passed through unchanged
+        """
+        details = {'dtype': np.float32, 'quantization': (0.0, 0)}
+        values = np.array([[-10.0, 0.2, 7.6]], dtype=np.float32)
+        np.testing.assert_array_equal(TFLiteModel.quantize(values, details), values)
+        np.testing.assert_array_equal(TFLiteModel.dequantize(values, details), values)
+
+    def testloadmodelpreferstflite(self):
+        """
+        Ensure load_model uses the TFLite model when the file exists
+        """
+        with tempfile.NamedTemporaryFile(suffix='.tflite') as tflite_file, \
+                mock.patch.object(predict_view, 'TFLITE_MODEL_PATH', tflite_file.name), \
+                mock.patch.object(predict_view, 'TFLiteModel') as tflite_model, \
+                mock.patch.object(predict_view, 'KerasModel') as keras_model:
+            self.assertIs(predict_view.load_model(), tflite_model.return_value)
+            tflite_model.assert_called_once_with(tflite_file.name)
+            keras_model.assert_not_called()
+
+    def testloadcorruptmodel(self):
+        """
+        Ensure a corrupt TFLite model falls back to the Keras model instead of failing
+        """
+        with tempfile.NamedTemporaryFile(suffix='.tflite') as tflite_file, \
+                mock.patch.object(predict_view, 'TFLITE_MODEL_PATH', tflite_file.name), \
+                mock.patch.object(predict_view, 'KerasModel') as keras_model:
+            tflite_file.write(b'not a model')
+            tflite_file.flush()
+            self.assertIs(predict_view.load_model(), keras_model.return_value)
+            keras_model.assert_called_once_with(predict_view.MODEL_PATH)
+
+    def testmodelfingerprint(self):
+        """
+        Ensure the fingerprint is the hash of the file of the loaded model
+        """
+        with tempfile.NamedTemporaryFile() as first_file, tempfile.NamedTemporaryFile() as second_file:
+            first_file.write(b'first model')
+            first_file.flush()
+            second_file.write(b'second model')
+            second_file.flush()
+            first = predict_view.model_fingerprint(mock.Mock(path=first_file.name))
+            second = predict_view.model_fingerprint(mock.Mock(path=second_file.name))
+        self.assertNotEqual(first, second)
+        self.assertEqual(predict_view.model_fingerprint(None), '')
+
+    def testconvert(self):
+        """
+        Ensure a Keras model is converted to a TFLite model that runs, without leaving temporary files
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            model_path = os.path.join(directory, 'model.h5')
+            tflite_path = os.path.join(directory, 'model.tflite')
+            calibration = os.path.join(directory, 'calibration')
+            os.makedirs(os.path.join(calibration, 'subdirectory'))
+            signals = np.random.RandomState(0).uniform(-1, 1, (4, 22050)).astype(np.float32)
+            for index, signal in enumerate(signals):
+                soundfile.write(os.path.join(calibration, '{}.wav'.format(index)), signal, 22050)
+            TestKerasModel.save_model(model_path)
+            with mock.patch.object(convert_tflite, 'MODEL_PATH', model_path), \
+                    mock.patch.object(convert_tflite, 'TFLITE_MODEL_PATH', tflite_path):
+                convert_tflite.convert(calibration)
+            self.assertEqual(sorted(os.listdir(directory)), ['calibration', 'model.h5', 'model.tflite'])
+            features = np.random.RandomState(1).normal(size=(2, N_MFCC, 1)).astype(np.float32)
+            self.assertEqual(TFLiteModel(tflite_path)(features).shape, (2, 8))
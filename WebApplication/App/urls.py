@@ -2,16 +2,40 @@
 Urls.py includes the url configurations of the application.
 """
 
+from functools import lru_cache
+
 from django.conf.urls import url
+from django.views.decorators.csrf import csrf_exempt
 
-from App.views import Predict
 from App.views import FileView
 from App.views import FileDeleteView
 
 app_name = 'App'
 
+
+@lru_cache(maxsize=None)
+def prediction_view(name):
+    """
+    This function imports a prediction view on first use, so the url configuration
+    does not load TensorFlow, Keras and librosa.
+    """
+    from App import predict_view
+    return getattr(predict_view, name).as_view()
+
+
+@csrf_exempt
+def predict(request, *args, **kwargs):
+    return prediction_view('Predict')(request, *args, **kwargs)
+
+
+@csrf_exempt
+def bulk_predict(request, *args, **kwargs):
+    return prediction_view('BulkPredict')(request, *args, **kwargs)
+
+
 urlpatterns = [
-    url(r'^predict/$', Predict.as_view(), name='APIpredict'),
+    url(r'^predict/$', predict, name='APIpredict'),
+    url(r'^bulkpredict/$', bulk_predict, name='APIbulkpredict'),
     url(r'^upload/$', FileView.as_view(), name='APIupload'),
     url(r'^delete/$', FileDeleteView.as_view(), name='APIdelete'),
 ]
@@ -1,19 +1,13 @@
 """
 views.py includes the main business logic of the application.
-Its role is to manage file upload, deletion and emotion predictions.
+Its role is to manage file upload and deletion.
+The emotion predictions are in predict_view.py.
 """
 
 import os
-from os import listdir
-from os.path import join
-from os.path import isfile
-import requests
 
-import keras
-import librosa
-import numpy as np
-import tensorflow as tf
 from django.conf import settings
+from django.core.cache import cache
 from django.views.generic import ListView
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView
@@ -25,10 +19,28 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.renderers import TemplateHTMLRenderer
 
+from App.cache_keys import MEDIA_LIST_KEY
 from App.models import FileModel
 from App.serialize import FileSerializer
 
 
+def scan_media_files():
+    """
+    This function returns the names of the files in the MEDIA_ROOT.
+    os.scandir gets the file type from the directory entry, without a stat() per file.
+    """
+    with os.scandir(settings.MEDIA_ROOT) as entries:
+        return [entry.name for entry in entries if entry.is_file()]
+
+
+def list_media_files():
+    """
+    This function returns the cached list of the files in the MEDIA_ROOT.
+    The cache is invalidated by the FileModel signals when a file is saved or deleted.
+    """
+    return cache.get_or_set(MEDIA_LIST_KEY, scan_media_files, timeout=30)
+
+
 class IndexView(TemplateView):
     """
     This is the index view of the website.
@@ -88,8 +100,7 @@ class SelectPredFileView(TemplateView):
         This function is used to render the list of files in the MEDIA_ROOT in the html template.
         """
         context = super().get_context_data(**kwargs)
-        media_path = settings.MEDIA_ROOT
-        myfiles = [f for f in listdir(media_path) if isfile(join(media_path, f))]
+        myfiles = list_media_files()
         context['filename'] = myfiles
         return context
 
@@ -110,14 +121,9 @@ class SelectFileDelView(TemplateView):
         and to get the pk (primary key) of each file.
         """
         context = super().get_context_data(**kwargs)
-        media_path = settings.MEDIA_ROOT
-        myfiles = [f for f in listdir(media_path) if isfile(join(media_path, f))]
-        primary_key_list = []
-        for value in myfiles:
-            primary_key = FileModel.objects.filter(file=value).values_list('pk', flat=True)
-            primary_key_list.append(primary_key)
-        file_and_pk = zip(myfiles, primary_key_list)
-        context['filename'] = file_and_pk
+        myfiles = list_media_files()
+        primary_keys = dict(FileModel.objects.filter(file__in=myfiles).values_list('file', 'pk'))
+        context['filename'] = [(value, primary_keys.get(value)) for value in myfiles]
         return context
 
 
@@ -136,11 +142,9 @@ class FileDeleteView(views.APIView):
     def post(self, request):
         """
         This method is used delete a file.
-        In the identifier variable we are storing a QuerySet object.
-        In the primary key object the id is extracted from the QuerySet string.
+        The primary key of the file is posted by the select_file_deletion template.
         """
-        identifier = request.POST.getlist('pk').pop()
-        primary_key = identifier[identifier.find("[") + 1:identifier.find("]")]
+        primary_key = request.POST.getlist('pk').pop()
         delete_action = get_object_or_404(FileModel, pk=primary_key).delete()
         try:
             return Response({'pk': delete_action}, status=status.HTTP_200_OK)
@@ -176,12 +180,13 @@ class FileView(views.APIView):
         This method will receive as input the file the user wants to store
         on the server and check if a resource (an url including
         the filename as endpoint) is existing.
-        If this function returns False, the user should not be able to save the
+        The resources under /media/ are served from the MEDIA_ROOT, so the
+        file system is checked instead of requesting the url.
+        If this function returns True, the user should not be able to save the
         file (or at least he/she should be prompted with a message saying that
         the file is already existing)
         """
-        request = requests.get('/media/' + file_name)
-        check = bool(request.status_code == 200)
+        check = os.path.exists(os.path.join(settings.MEDIA_ROOT, file_name))
         return check
 
     @staticmethod
@@ -190,11 +195,11 @@ class FileView(views.APIView):
         This method will receive as input the file the user wants to store
         on the server and check if a file with this name is physically in
         the server folder.
-        If this function returns False, the user should not be able to save the
+        If this function returns True, the user should not be able to save the
         file (or at least he/she should be prompted with a message saying that
         the file is already existing)
         """
-        check = bool(str(os.path.join(settings.MEDIA_ROOT, file_name)))
+        check = os.path.isfile(os.path.join(settings.MEDIA_ROOT, file_name))
         return check
 
     @staticmethod
@@ -203,60 +208,9 @@ class FileView(views.APIView):
         This method will receive as input the file the user wants to store
         on the server and check if an object with that name exists in the
         database.
-        If this function returns False, the user should not be able to save the
+        If this function returns True, the user should not be able to save the
         file (or at least he/she should be prompted with a message saying that
         the file is already existing)
         """
-        check = FileModel.objects.get(name=file_name).exists()
+        check = FileModel.objects.filter(file=file_name).exists()
         return check
-
-
-class Predict(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        model_path = os.path.join(settings.MODEL_ROOT, 'Emotion_Voice_Detection_Model.h5')
-        self.model = load_model(model_path)
-
-    def post(self, request, format=None):
-        audio_file = request.FILES.get('file', None)
-        if not audio_file:
-            return Response({'error': 'No audio file provided'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Save the uploaded file temporarily
-        tmp_path = os.path.join(settings.MEDIA_ROOT, audio_file.name)
-        with open(tmp_path, 'wb+') as temp_file:
-            for chunk in audio_file.chunks():
-                temp_file.write(chunk)
-
-        try:
-            data, sampling_rate = librosa.load(tmp_path, sr=None)
-            mfccs = np.mean(librosa.feature.mfcc(y=data, sr=sampling_rate, n_mfcc=40).T, axis=0)
-            features = np.expand_dims(mfccs, axis=2)
-            features = np.expand_dims(features, axis=0)
-            preds = self.model.predict(features)
-            predicted_class = np.argmax(preds, axis=1)[0]
-            emotion_label = self.classtoemotion(predicted_class)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        finally:
-            # Clean up the temp file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-
-        return Response({'prediction': emotion_label}, status=status.HTTP_200_OK)
-
-    @staticmethod
-    def classtoemotion(pred):
-        label_map = {
-            0: 'neutral',
-            1: 'calm',
-            2: 'happy',
-            3: 'sad',
-            4: 'angry',
-            5: 'fearful',
-            6: 'disgust',
-            7: 'surprised'
-        }
-        return label_map.get(pred, 'unknown')
@@ -20,6 +20,23 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Url to store the model
 MODEL_ROOT = os.path.join(BASE_DIR, "models")
 
+# Audio preprocessing applied before the predictions.
+# Both are disabled by default, as the model was trained on untrimmed and unnormalized audio.
+# TRIM_SILENCE_THRESHOLD is the amplitude below which leading and trailing samples are removed.
+TRIM_SILENCE_THRESHOLD = None
+NORMALIZE_AUDIO = False
+
+# Number of processes extracting the audio features in each server process.
+# Every gunicorn worker has its own pool, so the cores are shared between the workers:
+# with W workers on C cores, about C // W processes per pool keep all the cores busy
+# without oversubscribing them. By default, the cores are divided between the workers
+# set with WEB_CONCURRENCY, which gunicorn also reads.
+FEATURE_WORKERS = int(os.environ.get(
+    'FEATURE_WORKERS', max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)))))
+
+# Cache the numba compiled functions, so the workers do not compile them again.
+os.environ.setdefault('NUMBA_CACHE_DIR', '/tmp/numba_cache')
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
@@ -158,6 +175,24 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Memcached is used when MEMCACHED_LOCATION is set, so that all the workers share the cache.
+
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 